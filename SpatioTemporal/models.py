@@ -1,4 +1,6 @@
 from typing import List
+import copy
+import numpy as np
 
 class Point:
     """Point class.
@@ -51,19 +53,35 @@ class Trajectory:
 class TPartition:
     """TPartition class, the timeslice with its corresponding points.
 
+    Notes
+    -----
+    Coordinates are stored as a (n, 2) ndarray so clustering can consume them
+    directly. TPoint objects are only built when .tpoints is accessed.
+
     Parameters
     ----------
     ts : int
         The lower time limit of partition.
-    te : int 
+    te : int
         The upper time limit of partition.
-    tpoints : list
-        A list of TPoints in partition.
+    tpoints : list, default=None
+        A list of TPoints in partition. Optional if 'xy' is given.
+    xy : ndarray, default=None
+        A (n, 2) array with the coordinates of the points in partition. Optional if 'tpoints' is given.
     """
-    def __init__(self, ts : int, te : int, tpoints : List[TPoint]):
+    def __init__(self, ts : int, te : int, tpoints : List[TPoint] = None, xy : np.ndarray = None):
         self.ts = ts
         self.te = te
-        self.tpoints = tpoints
+        if xy is None:
+            xy = np.asarray([[m.x, m.y] for m in tpoints], dtype=np.float64)
+        self.xy = xy
+        self._tpoints = tpoints
+
+    @property
+    def tpoints(self) -> List[TPoint]:
+        if self._tpoints is None:
+            self._tpoints = [TPoint(x, y, self.ts) for x, y in self.xy]
+        return self._tpoints
 
 
 class ClusterPoint(TPoint):
@@ -87,25 +105,54 @@ class ClusterPoint(TPoint):
 class Cluster:
     """Cluster class, a cluster of cluster points.
 
+    Notes
+    -----
+    Coordinates are stored as a (n, 2) ndarray so numeric code can work on one
+    contiguous array. ClusterPoint objects are only built when .cpoints is accessed.
+
     Parameters
     ----------
     id : int
         A unique identifier.
-    cpoints : list
-        A list of ClusterPoint objects.
+    cpoints : list, default=None
+        A list of ClusterPoint objects. Optional if 'xy' is given.
     t : int
         Timestamp
     c : int, default=None
         Cluster label
+    xy : ndarray, default=None
+        A (n, 2) array with the coordinates of the cluster points. Optional if 'cpoints' is given.
     """
-    def __init__(self, id : int, cpoints : List[ClusterPoint], t : int, c : int = None):
+    def __init__(self, id : int, cpoints : List[ClusterPoint] = None, t : int = None, c : int = None, xy : np.ndarray = None):
         self.id = id
-        self.cpoints = cpoints
-        mx, my = sum([cp.x for cp in cpoints]) / len(cpoints), sum([cp.y for cp in cpoints]) / len(cpoints)
+        if xy is None:
+            # One fromiter pass instead of materializing an intermediate list.
+            xy = np.fromiter((v for cp in cpoints for v in (cp.x, cp.y)),
+                             dtype=np.float64, count=2 * len(cpoints)).reshape(-1, 2)
+        self.xy = xy
+        self._cpoints = cpoints
+        mx, my = self.xy.mean(axis=0)
         self.m = Point(mx, my)
         self.t = t
         self.c = c
 
+    @property
+    def cpoints(self) -> List[ClusterPoint]:
+        if self._cpoints is None:
+            self._cpoints = [ClusterPoint(x, y, self.t, self.c) for x, y in self.xy]
+        return self._cpoints
+
+    def with_label(self, id : int, c : int) -> 'Cluster':
+        """Returns a shallow copy with a new id and cluster label.
+
+        The copy shares the coordinate array and centroid, so no per-point
+        work is repeated just to relabel the cluster.
+        """
+        new = copy.copy(self)
+        new.id = id
+        new.c = c
+        return new
+
 class GetisCluster(Cluster):
     """GetisCluster class, the cluster of points to evaluate its Gi* and statisticaly characterize as 'Hot', 'Cold' or None.
 
@@ -113,10 +160,12 @@ class GetisCluster(Cluster):
     ----------
     id : int
         A unique identifier.
-    cpoints : list
-        A list of ClusterPoint objects.
+    cpoints : list, default=None
+        A list of ClusterPoint objects. Optional if 'xy' is given.
     t : int
         Timestamp
+    xy : ndarray, default=None
+        A (n, 2) array with the coordinates of the cluster points. Optional if 'cpoints' is given.
 
     Attributes
     ----------
@@ -131,9 +180,9 @@ class GetisCluster(Cluster):
     spot : str
         The characterization of the cluster, 'Hot', 'Cold' or None.    
     """
-    def __init__(self, id : int, cpoints : List[ClusterPoint], t : int):
-        super().__init__(id = id, cpoints = cpoints, t = t)
-        self.x = len(cpoints)
+    def __init__(self, id : int, cpoints : List[ClusterPoint] = None, t : int = None, xy : np.ndarray = None):
+        super().__init__(id = id, cpoints = cpoints, t = t, xy = xy)
+        self.x = len(self.xy)
         self.gi = None
         self.significant = False
         self.spot = None
\ No newline at end of file
@@ -1,13 +1,100 @@
-from matplotlib.pyplot import vlines
 from sklearn.metrics.pairwise import haversine_distances
-from .models import * 
+from .models import *
 from sklearn.cluster import DBSCAN
-from collections import OrderedDict
+from sklearn.neighbors import NearestNeighbors, sort_graph_by_row_values
+from joblib import Parallel, delayed
 import numpy as np
-from math import sqrt, exp, radians
 from typing import Dict, List, Literal, Tuple
 from sklearn.base import BaseEstimator
 
+try:
+    from numba import njit, prange
+except ImportError: # pragma: no cover - numba is in environment.yml but optional at runtime
+    njit = None
+
+
+# Critical values of the Gi* hypothesis testing for the supported significance levels.
+_CRITICALS = {0.10: 1.65, 0.05: 1.96, 0.01: 2.58}
+
+
+if njit is not None:
+    @njit(parallel=True, fastmath=True)
+    def _gi_kernel(lat : np.ndarray, lon : np.ndarray, t : np.ndarray, x : np.ndarray, x_bar : float, S : float) -> np.ndarray:
+        """Computes the Gi* statistic of every cluster in a window.
+
+        Fuses the haversine distance and the weight exp(-(|ti-tj|+1)*dij) per
+        pair, so no (n, n) distance matrix is ever materialized. 'lat'/'lon'
+        are in radians and distances are central angles, matching sklearn's
+        haversine_distances.
+        """
+        n = lat.shape[0]
+        gi = np.empty(n, dtype=np.float32)
+        for i in prange(n):
+            swx = 0.0
+            sw = 0.0
+            sw2 = 0.0
+            for j in range(n):
+                dlat = lat[j] - lat[i]
+                dlon = lon[j] - lon[i]
+                h = np.sin(dlat / 2) ** 2 + np.cos(lat[i]) * np.cos(lat[j]) * np.sin(dlon / 2) ** 2
+                d = 2 * np.arcsin(np.sqrt(h))
+                w = np.exp(-(abs(t[i] - t[j]) + 1) * d)
+                swx += w * x[j]
+                sw += w
+                sw2 += w * w
+            gi[i] = (swx - x_bar * sw) / (S * np.sqrt((n * sw2 - sw ** 2) / (n - 1)))
+        return gi
+
+
+def _with_kd_tree(clustering : BaseEstimator, args : Dict[str, object]) -> Dict[str, object]:
+    """Defaults DBSCAN to the kd_tree neighbor algorithm.
+
+    All data clustered in this module is 2D, where a k-d tree turns the
+    neighborhood queries into O(n log n). User-provided 'algorithm' or
+    'metric' args are left untouched.
+    """
+    if clustering is DBSCAN and 'algorithm' not in args and 'metric' not in args:
+        args = dict(args, algorithm='kd_tree')
+    return args
+
+
+def _fit_partition(Gj : TPartition, g_clustering : BaseEstimator, g_clustering_args : Dict[str, object]) -> List[Tuple[int, np.ndarray]]:
+    """Clusters the points of a single time partition.
+
+    Runs at module level so joblib workers can pickle it.
+
+    Parameters
+    ----------
+    Gj : TPartition
+        The time partition to cluster.
+    g_clustering : BaseEstimator
+        A class that perfroms clustering, having the .fit() method.
+    g_clustering_args : dict
+        Dict-like args for the g_clustering.
+
+    Returns
+    -------
+    groups : list
+        A list of (label, xy) tuples, one per discovered cluster, in
+        first-occurrence order of the label. Noise (-1) is ignored.
+    """
+    data = Gj.xy
+    if len(data) == 0:
+        return []
+
+    model = g_clustering(**g_clustering_args)
+    model.fit(data)
+
+    # Group points per label in one vectorized pass, ignoring noise (-1).
+    labels = model.labels_
+    order = np.argsort(labels, kind='stable')
+    order = order[labels[order] != -1]
+    sorted_lbls = labels[order]
+    uniq, starts = np.unique(sorted_lbls, return_index=True)
+    ends = np.append(starts[1:], len(sorted_lbls))
+
+    return [(uniq[k], data[order[starts[k]:ends[k]]]) for k in np.argsort(order[starts])]
+
 
 class ST:
     """Base class of STC and STHS.
@@ -22,16 +109,21 @@ class ST:
         interval : int, default=10
             The interval of timeslices to create (T time partition).
         w : int, default=3
-            The number of time partitions (time window) to aggregate and perfom v_clustering. 
+            The number of time partitions (time window) to aggregate and perfom v_clustering.
+        n_jobs : int, default=-1
+            The number of joblib workers for the per-partition clustering. -1 uses all cores.
     """
-    def __init__(self, g_clustering : BaseEstimator = DBSCAN, 
-                       g_clustering_args : Dict[str, object] = {'eps': 1, 'min_samples': 2}, 
+    def __init__(self, g_clustering : BaseEstimator = DBSCAN,
+                       g_clustering_args : Dict[str, object] = {'eps': 1, 'min_samples': 2},
                        interval : int = 10,
-                       w : int = 3):
+                       w : int = 3,
+                       n_jobs : int = -1):
         self.g_clustering = g_clustering
-        self.g_clustering_args = g_clustering_args
+        self.g_clustering_args = _with_kd_tree(g_clustering, g_clustering_args)
         self.interval = interval
         self.w = w
+        self.n_jobs = n_jobs
+        self._G_cache = None
 
 
     def _create_G(self, trajs : List[Trajectory]) -> List[TPartition]:
@@ -39,30 +131,60 @@ class ST:
         G = {G_1, G_2, ..., G_n}
         G_1 = {g_11, g_12, ..., g_1m}
 
+        Notes
+        -----
+        The latest result is memoized together with a reference to its trajectory
+        list, so refitting on the same list during parameter sweeps (e.g. over w
+        or a) is free. Holding the reference keeps the identity check sound and
+        the single entry bounds the cache.
+
         Paramters
         ---------
         trajs : list
             A list of Trajectory objects
-        
+
         Returns
         -------
         G : list
             A list of TPartition objects, i.e. the Gj, starting time, end time for that partition.
         """
+        if self._G_cache is not None:
+            cached_trajs, cached_interval, cached_G = self._G_cache
+            if cached_trajs is trajs and cached_interval == self.interval:
+                self.G = cached_G
+                return self.G
+
+        n = len(trajs)
+        ts = np.fromiter((tr.tps.t for tr in trajs), dtype=np.int64, count=n)
+        te = np.fromiter((tr.tpe.t for tr in trajs), dtype=np.int64, count=n)
+        mx = np.fromiter((tr.m.x for tr in trajs), dtype=np.float64, count=n)
+        my = np.fromiter((tr.m.y for tr in trajs), dtype=np.float64, count=n)
+        xy = np.column_stack((mx, my))
+
+        time_range = int(te.max())
+        nbins = len(range(0, time_range, self.interval))
+
+        # A trajectory is alive in bin b iff ts <= (b+1)*interval and te >= b*interval,
+        # so its bins are exactly the range [first, last]. Expanding those ranges with
+        # np.repeat buckets all trajectories in one pass instead of rescanning them per bin.
+        first = np.maximum((ts - 1) // self.interval, 0)
+        last = np.minimum(te // self.interval, nbins - 1)
+        spans = np.maximum(last - first + 1, 0)
+
+        traj_idx = np.repeat(np.arange(n), spans)
+        offsets = np.arange(traj_idx.size) - np.repeat(np.cumsum(spans) - spans, spans)
+        bin_idx = np.repeat(first, spans) + offsets
+
+        order = np.argsort(bin_idx, kind='stable')
+        members = traj_idx[order]
+        starts = np.searchsorted(bin_idx[order], np.arange(nbins + 1))
+
         G = []
-        time_range = max(tr.tpe.t for tr in trajs)
-        for t in range(0, time_range, self.interval):
-            t1 = t
-            t2 = t + self.interval
-            Gj = []
-            for tr in trajs:
-                if tr.tps.t > t2 or tr.tpe.t < t1:
-                    continue
-                m_new = TPoint(tr.m.x, tr.m.y, t1)
-
-                Gj.append(m_new)
-            G.append(TPartition(t1, t2, Gj))
+        for b in range(nbins):
+            t1 = b * self.interval
+            G.append(TPartition(t1, t1 + self.interval, xy=xy[members[starts[b]:starts[b + 1]]]))
 
+        self._G_cache = (trajs, self.interval, G)
         self.G = G
         return G
 
@@ -80,33 +202,17 @@ class ST:
         K : list
             A list of lists of Cluster objects, i.e. the clusters of each time partition.
         """
+        # Every partition is clustered independently, so fan the fits out to workers.
+        results = Parallel(n_jobs=self.n_jobs, backend='loky')(
+            delayed(_fit_partition)(Gj, self.g_clustering, self.g_clustering_args) for Gj in G)
+
+        # Ids are assigned in a single post-pass so workers don't share state.
         K = []
         id = 0
-        for Gj in G:
-            data = np.array([[m.x, m.y] for m in Gj.tpoints])
-
-            if len(data) == 0:
-                K.append([])
-                continue
-
-            model = self.g_clustering(**self.g_clustering_args)
-            model.fit(data)            
-
-            clusters = {}
-            for i in range(len(data)):
-                if model.labels_[i] == -1: # ignore noise
-                    continue
-
-                if model.labels_[i] not in clusters:
-                    clusters[model.labels_[i]] = []
-                clusters[model.labels_[i]].append(data[i])
-
+        for Gj, groups in zip(G, results):
             Kj = []
-            for k, v in clusters.items():
-                cps = []
-                for coords in v:
-                   cps.append(ClusterPoint(coords[0], coords[1], Gj.ts, k))
-                Kj.append(Cluster(id = id, cpoints = cps, t = Gj.ts, c = k))
+            for k, xy in groups:
+                Kj.append(Cluster(id = id, t = Gj.ts, c = k, xy = xy))
                 id += 1
             K.append(Kj)
         return K
@@ -130,14 +236,16 @@ class STC(ST):
     interval : int, default=10
         The interval of timeslices to create (T time partition).
     w : int, default=3
-        The number of time partitions (time window) to aggregate and perfom v_clustering. 
+        The number of time partitions (time window) to aggregate and perfom v_clustering.
+    n_jobs : int, default=-1
+        The number of joblib workers for the per-partition clustering. -1 uses all cores.
     """
     def __init__(self, g_clustering : BaseEstimator = DBSCAN, g_clustering_args : Dict[str, object] = {'eps': 1, 'min_samples': 2},
                        v_clustering : BaseEstimator = DBSCAN, v_clustering_args : Dict[str, object] = {'eps': 1, 'min_samples': 2},
-                       interval : int = 10, w : int = 3):
-        super().__init__(g_clustering=g_clustering, g_clustering_args=g_clustering_args, interval=interval, w = w)
+                       interval : int = 10, w : int = 3, n_jobs : int = -1):
+        super().__init__(g_clustering=g_clustering, g_clustering_args=g_clustering_args, interval=interval, w = w, n_jobs = n_jobs)
         self.v_clustering = v_clustering
-        self.v_clustering_args = v_clustering_args
+        self.v_clustering_args = _with_kd_tree(v_clustering, v_clustering_args)
         
     
 
@@ -156,6 +264,19 @@ class STC(ST):
         N : list
             A list of lists of Cluster object with cluster label equal to -1 (noise), i.e. the noise of each Vj.
         """
+        # When the clusterer is a plain DBSCAN, compute the radius neighbor graph of
+        # all cluster centroids once and slice it per window, so the overlapping
+        # windows do not rebuild the same neighborhoods w times.
+        precompute = self.v_clustering is DBSCAN and 'metric' not in self.v_clustering_args
+        graph = None
+        if precompute:
+            centroids = np.array([[cluster.m.x, cluster.m.y] for Kj in K for cluster in Kj])
+            offsets = np.cumsum([0] + [len(Kj) for Kj in K])
+            if len(centroids) > 0:
+                eps = self.v_clustering_args.get('eps', 0.5)
+                nn = NearestNeighbors(radius=eps, algorithm='kd_tree').fit(centroids)
+                graph = nn.radius_neighbors_graph(mode='distance')
+
         R = []
         N = []
         for i in range(len(K) - self.w + 1):
@@ -163,19 +284,28 @@ class STC(ST):
             Vj = [K[j] for j in range(i, i + self.w)]
             Vj = [item for sublist in Vj for item in sublist] # flatten list
 
-            x1 = [cluster.m.x for cluster in Vj]
-            x2 = [cluster.m.y for cluster in Vj]
-            data = list(zip(x1,x2))
-            if len(data) == 0:
+            if len(Vj) == 0:
                 R.append([])
                 N.append([])
                 continue
-            
-            model = self.v_clustering(**self.v_clustering_args)
-            model.fit(data)
 
-            Rj = [Cluster(i, cpoints=cluster.cpoints, t=cluster.t, c=model.labels_[i]) for i, cluster in enumerate(Vj) if model.labels_[i] != -1]
-            Nj = [Cluster(i, cpoints=cluster.cpoints, t=cluster.t, c=model.labels_[i]) for i, cluster in enumerate(Vj) if model.labels_[i] == -1]
+            if graph is not None:
+                s, e = offsets[i], offsets[i + self.w]
+                sub = graph[s:e, s:e]
+                sub.setdiag(0.0) # every centroid is its own neighbor
+                sub = sort_graph_by_row_values(sub, warn_when_not_sorted=False)
+                args = {k: v for k, v in self.v_clustering_args.items() if k != 'algorithm'}
+                model = self.v_clustering(metric='precomputed', **args)
+                model.fit(sub)
+            else:
+                data = np.empty((len(Vj), 2))
+                data[:, 0] = [cluster.m.x for cluster in Vj]
+                data[:, 1] = [cluster.m.y for cluster in Vj]
+                model = self.v_clustering(**self.v_clustering_args)
+                model.fit(data)
+
+            Rj = [cluster.with_label(i, model.labels_[i]) for i, cluster in enumerate(Vj) if model.labels_[i] != -1]
+            Nj = [cluster.with_label(i, model.labels_[i]) for i, cluster in enumerate(Vj) if model.labels_[i] == -1]
 
             R.append(Rj)
             N.append(Nj)
@@ -242,46 +372,11 @@ class STHS(ST):
         for Kj in K:
             GCj = []
             for cluster in Kj:
-                GCj.append(GetisCluster(cluster.id, cluster.cpoints, cluster.c))
+                GCj.append(GetisCluster(cluster.id, t = cluster.c, xy = cluster.xy))
             GC.append(GCj)
         return GC
 
 
-    def _calculate_distance(self, GC : List[List[GetisCluster]]) -> Dict[int, Dict[int, float]]:
-        """Calculates a distance matrix of all GetisCluster objects.
-        
-        Notes
-        -----
-        Haverinse distance is calculated in this implementation.
-
-        Parameters
-        ----------
-        GC : list
-           A list of lists of GetisCluster objects, i.e the getis clusters if each time partition.
-
-        Returns
-        -------
-        distances : dict
-            A dict of dicts with clusters' id as keys and the distance as value
-        """
-        distances = {}
-        for i in range(len(GC)):
-            GCja = GC[i]
-            for clustera in GCja:
-                distances[clustera.id] = {}
-                p1 = [[radians(clustera.m.y), radians(clustera.m.x)]] #(lat, lon)
-                try:
-                    for j in range(i, i + self.w):
-                        GCjb = GC[j]
-                        for clusterb in GCjb:
-                            p2 = [[radians(clusterb.m.y), radians(clusterb.m.x)]]
-                            distances[clustera.id][clusterb.id] = haversine_distances(p1,p2)[0][0]
-                except IndexError:
-                    continue
-
-        return distances
-
-
     def _calculate_getis_ord(self, GC : List[List[GetisCluster]], a : float = 0.01) -> List[List[GetisCluster]]:
         """Calculates the Gi* statistic for every GetisCluster in Vj, for every Vj.
         
@@ -302,50 +397,56 @@ class STHS(ST):
         V : list
             A list of lists of GetisCluster objects having calculated Gi* and updated spot characterization ('Hot'/'Cold'/None)
         """
-        distances = self._calculate_distance(GC)
-
-        def weight(z, gc1, gc2):
-            try:
-                return 1*exp(-(z+1)*distances[gc1.id][gc2.id])
-            except KeyError:
-                return 1*exp(-(z+1)*distances[gc2.id][gc1.id])
-            
+        try:
+            critical = _CRITICALS[a]
+        except KeyError:
+            raise ValueError("'a' must be 0.10, 0.05 or 0.01.")
+
+        # Each partition sits in up to w windows, so its attribute arrays are
+        # extracted once here and the windows below just concatenate slices.
+        # float32 is plenty for the Gi* z-score and halves the memory bandwidth
+        # of the weight computation.
+        xs = [np.array([gc.x for gc in GCj], dtype=np.float32) for GCj in GC]
+        ts = [np.array([gc.t for gc in GCj], dtype=np.float32) for GCj in GC]
+        pts_j = [np.radians([[gc.m.y, gc.m.x] for gc in GCj]).astype(np.float32) #(lat, lon)
+                 if GCj else np.empty((0, 2), dtype=np.float32) for GCj in GC]
 
         V = []
         for i in range(len(GC) - self.w + 1):
 
-            Vj = [gc for j in range(i, i + self.w) for gc in GC[j]]           
+            Vj = [gc for j in range(i, i + self.w) for gc in GC[j]]
             n = len(Vj)
             if n == 0:
                 V.append(Vj)
                 continue
-            x_bar = sum(gc.x for gc in Vj) / n
-            S = sqrt(sum(gc.x ** 2 for gc in Vj) / n - x_bar ** 2) 
-
-            for gc1 in Vj:
-                swx = 0
-                sw = 0
-                sw2 = 0
-                for gc2 in Vj:
-                    z = abs(gc1.t - gc2.t)
-                    w = weight(z, gc1, gc2)
-                    swx += w * gc2.x  
-                    sw += w
-                    sw2 += w ** 2
-                gc1.gi = (swx - x_bar * sw) / (S * sqrt((n * sw2 - sw ** 2) / (n - 1)))
-                if a == 0.10:
-                    critical = 1.65
-                elif a == 0.05:
-                    critical = 1.96
-                elif a == 0.01:
-                    critical = 2.58
-                else:
-                    raise ValueError("'a' must be 0.10, 0.05 or 0.01.")
-                
-                if gc1.gi <= -critical:
+            x = np.concatenate(xs[i:i + self.w])
+            t = np.concatenate(ts[i:i + self.w])
+
+            x_bar = x.mean()
+            S = np.sqrt((x ** 2).mean() - x_bar ** 2)
+
+            pts = np.concatenate(pts_j[i:i + self.w])
+            if njit is not None:
+                gi = _gi_kernel(np.ascontiguousarray(pts[:, 0]), np.ascontiguousarray(pts[:, 1]), t, x, x_bar, S)
+            else:
+                Dj = haversine_distances(pts, pts).astype(np.float32)
+
+                # Weight matrix of the window: w_ij = exp(-(|t_i - t_j| + 1) * d_ij)
+                Z = np.abs(t[:, None] - t[None, :])
+                W = np.exp(-(Z + 1) * Dj)
+                swx = W @ x
+                sw = W.sum(axis=1)
+                sw2 = (W * W).sum(axis=1)
+                gi = (swx - x_bar * sw) / (S * np.sqrt((n * sw2 - sw ** 2) / (n - 1)))
+            cold = gi <= -critical
+            hot = gi >= critical
+
+            for k, gc1 in enumerate(Vj):
+                gc1.gi = gi[k]
+                if cold[k]:
                     gc1.significant = True
                     gc1.spot = 'Cold'
-                elif gc1.gi >= critical:
+                elif hot[k]:
                     gc1.significant = True
                     gc1.spot = 'Hot'
             V.append(Vj)
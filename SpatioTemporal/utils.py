@@ -1,5 +1,4 @@
-import random
-import matplotlib.pyplot as plt
+import numpy as np
 from .models import *
 from math import ceil
 
@@ -10,7 +9,7 @@ MIN_Y_RANDOM = 37
 MAX_Y_RANDOM = 38
 VARIANCE = 0.06
 
-def _generate_traj(N : int, n_clusters : int, time_range : int, noise : bool = False) -> List[Trajectory]:
+def _generate_traj(N : int, n_clusters : int, time_range : int, rng : np.random.Generator, noise : bool = False) -> List[Trajectory]:
     """Generates simulated trajectories in the extend of Saronic.
 
     Parameters
@@ -21,6 +20,8 @@ def _generate_traj(N : int, n_clusters : int, time_range : int, noise : bool = F
         Number of clusters to simulate.
     time_range : int
         The maximum timestamp of the generated trajectory points, [0, time_range]
+    rng : Generator
+        The numpy random generator to draw from.
     noise : bool, default=False
         Generate noise if True.
 
@@ -29,44 +30,32 @@ def _generate_traj(N : int, n_clusters : int, time_range : int, noise : bool = F
     trajs : list
         The generated trajectories.
     """
-    if not noise: 
-        # Create 'n_clusters' points as seed for the simulated clusters.
-        X = [random.uniform(MIN_X_RANDOM,MAX_X_RANDOM) for _ in range(n_clusters)] 
-        Y = [random.uniform(MIN_Y_RANDOM,MAX_Y_RANDOM) for _ in range(n_clusters)]
-
-    trajs = []
-    for _ in range(N):
-        while True:
-            # random_time = random.randint(0,3)
-            # if random_time == 0:
-            #     ts = time_range - random.randint(0, time_range)
-            # else:
-            #     ts = time_range - int(random.gauss(time_range/2, time_range/100))
-
-            # Random generation of start time and end time of trajectory.
-            ts = time_range - random.randint(0, time_range)
-            te = ts + random.randint(0, time_range - ts)
-            
-            if te-ts != 0:
-                break
-
-        if not noise:
-            # Generate start and end trajectory point "near" the random cluster seed.
-            i = random.randint(0, n_clusters - 1)
-            xs, xe = (random.gauss(X[i], VARIANCE) for _ in range(2))
-            ys, ye = (random.gauss(Y[i], VARIANCE) for _ in range(2))
-        else:
-            # In case of noise generation, generate random point in the extend.
-            x = random.uniform(MIN_X_RANDOM + VARIANCE, MAX_X_RANDOM - VARIANCE)
-            y = random.uniform(MIN_Y_RANDOM + VARIANCE, MAX_Y_RANDOM - VARIANCE)
-            xs, xe = (random.gauss(x, VARIANCE) for _ in range(2))
-            ys, ye = (random.gauss(y, VARIANCE) for _ in range(2))
-
-        tps = TPoint(xs, ys, ts)
-        tpe = TPoint(xe, ye, te) 
-        trajs.append(Trajectory(tps, tpe))
-
-    return trajs
+    # Random generation of start time and end time of trajectory, drawn in
+    # batches; zero-duration trajectories are redrawn until none remain.
+    ts = rng.integers(0, time_range + 1, N)
+    te = ts + rng.integers(0, time_range - ts + 1)
+    bad = te == ts
+    while bad.any():
+        ts[bad] = rng.integers(0, time_range + 1, bad.sum())
+        te[bad] = ts[bad] + rng.integers(0, time_range - ts[bad] + 1)
+        bad = te == ts
+
+    if not noise:
+        # Create 'n_clusters' points as seed for the simulated clusters and generate
+        # start and end trajectory points "near" a randomly picked cluster seed.
+        X = rng.uniform(MIN_X_RANDOM, MAX_X_RANDOM, n_clusters)
+        Y = rng.uniform(MIN_Y_RANDOM, MAX_Y_RANDOM, n_clusters)
+        i = rng.integers(0, n_clusters, N)
+        x, y = X[i], Y[i]
+    else:
+        # In case of noise generation, generate random points in the extend.
+        x = rng.uniform(MIN_X_RANDOM + VARIANCE, MAX_X_RANDOM - VARIANCE, N)
+        y = rng.uniform(MIN_Y_RANDOM + VARIANCE, MAX_Y_RANDOM - VARIANCE, N)
+
+    xs, xe = rng.normal(x, VARIANCE), rng.normal(x, VARIANCE)
+    ys, ye = rng.normal(y, VARIANCE), rng.normal(y, VARIANCE)
+
+    return [Trajectory(TPoint(xs[k], ys[k], int(ts[k])), TPoint(xe[k], ye[k], int(te[k]))) for k in range(N)]
 
 
 def generate_samples(N : int = 1000, p : float = 0.5, n_clusters : int = 3, time_range : int = 100, random_state : int = None) -> List[Trajectory]:
@@ -91,14 +80,13 @@ def generate_samples(N : int = 1000, p : float = 0.5, n_clusters : int = 3, time
     trajs : list
         List of clustered and noise simulated trajectories.
     """
-    if random_state is not None:
-        random.seed(random_state)
+    rng = np.random.default_rng(random_state)
 
     # Generate clusters
-    trajs = _generate_traj(int(N*(1-p)), n_clusters, time_range, noise=False)
+    trajs = _generate_traj(int(N*(1-p)), n_clusters, time_range, rng, noise=False)
 
     # Generate noise
-    trajs_noise = _generate_traj(int(N*p), None, time_range, noise=True)
+    trajs_noise = _generate_traj(int(N*p), None, time_range, rng, noise=True)
 
     return trajs + trajs_noise
 
@@ -133,8 +121,12 @@ def display(trajs : List[Trajectory] = None,
     V : list
         A list of lists of GetisCluster objects having calculated Gi* and updated spot characterization ('Hot'/'Cold'/None) (requires w)
     ais : bool, default=False
-        Trajs are ais data or not, specifies the extend.    
+        Trajs are ais data or not, specifies the extend.
     """
+    # Imported lazily so numeric-only users of STC/STHS don't pay the
+    # matplotlib import cost.
+    import matplotlib.pyplot as plt
+
     if trajs is not None:
 
         Xs = [tr.tps.x for tr in trajs]
@@ -172,15 +164,13 @@ def display(trajs : List[Trajectory] = None,
                 index = i*3 + j
                 if index >= n:
                     continue
-                x = [p.x for cluster in R[index] for p in cluster.cpoints]
-                y = [p.y for cluster in R[index] for p in cluster.cpoints]
-                c = [cluster.c for cluster in R[index] for p in cluster.cpoints]
-                clusters = ax[i][j].scatter(x, y, c=c, cmap='Set1', alpha=0.3)
+                xy = np.concatenate([cluster.xy for cluster in R[index]]) if R[index] else np.empty((0, 2))
+                c = np.repeat([cluster.c for cluster in R[index]], [len(cluster.xy) for cluster in R[index]])
+                clusters = ax[i][j].scatter(xy[:, 0], xy[:, 1], c=c, cmap='Set1', alpha=0.3)
 
-                x = [p.x for cluster in N[index] for p in cluster.cpoints]
-                y = [p.y for cluster in N[index] for p in cluster.cpoints]
-                c = [i for i, cluster in enumerate(N[index]) for _ in cluster.cpoints]
-                noise = ax[i][j].scatter(x, y, c=c, s=80, edgecolor='black', marker='*', cmap='tab10', label='noise', alpha=0.5)
+                xy = np.concatenate([cluster.xy for cluster in N[index]]) if N[index] else np.empty((0, 2))
+                c = np.repeat(np.arange(len(N[index])), [len(cluster.xy) for cluster in N[index]])
+                noise = ax[i][j].scatter(xy[:, 0], xy[:, 1], c=c, s=80, edgecolor='black', marker='*', cmap='tab10', label='noise', alpha=0.5)
 
                 if ais:
                     extent = [23.03014957562005, 23.85354971429277, 37.7, 38.06] # Extend for ais2018db
@@ -190,11 +180,7 @@ def display(trajs : List[Trajectory] = None,
 
                 ax[i][j].legend([clusters, noise], ['Clusters', 'Noise'])
 
-                count_clusters = []
-                for cluster in R[index]:
-                    if cluster.c not in count_clusters:
-                        count_clusters.append(cluster.c)
-                count_clusters = len(count_clusters)
+                count_clusters = len({cluster.c for cluster in R[index]})
                 count_noise = len(N[index])
                 ax[i][j].set_title(f"Time slices: {index} -  {index+w-1}\n# clusters: {count_clusters}, # noise: {count_noise}")
         fig.tight_layout(pad=0.3)    
@@ -209,31 +195,18 @@ def display(trajs : List[Trajectory] = None,
                 index = i*3 + j
                 if index >= n:
                     continue
-                hx = []
-                hy = []
-                cx = []
-                cy = []
-                nx = []
-                ny = []
-                count_hot = 0
-                count_cold = 0
-                count_none = 0
-                for gc in V[index]:
-                    if gc.spot == 'Hot':
-                        hx += [cp.x for cp in gc.cpoints]
-                        hy += [cp.y for cp in gc.cpoints]
-                        count_hot += 1
-                    elif gc.spot == 'Cold':
-                        cx += [cp.x for cp in gc.cpoints]
-                        cy += [cp.y for cp in gc.cpoints]
-                        count_cold += 1
-                    else:
-                        nx += [cp.x for cp in gc.cpoints]
-                        ny += [cp.y for cp in gc.cpoints]
-                        count_none += 1
-                ax[i][j].scatter(nx, ny, c='k', alpha=0.1)
-                ax[i][j].scatter(hx, hy, c='r', alpha=0.1)
-                ax[i][j].scatter(cx, cy, c='b', alpha=0.1)
+                hot = [gc.xy for gc in V[index] if gc.spot == 'Hot']
+                cold = [gc.xy for gc in V[index] if gc.spot == 'Cold']
+                none = [gc.xy for gc in V[index] if gc.spot is None]
+                count_hot = len(hot)
+                count_cold = len(cold)
+                count_none = len(none)
+                hxy = np.concatenate(hot) if hot else np.empty((0, 2))
+                cxy = np.concatenate(cold) if cold else np.empty((0, 2))
+                nxy = np.concatenate(none) if none else np.empty((0, 2))
+                ax[i][j].scatter(nxy[:, 0], nxy[:, 1], c='k', alpha=0.1)
+                ax[i][j].scatter(hxy[:, 0], hxy[:, 1], c='r', alpha=0.1)
+                ax[i][j].scatter(cxy[:, 0], cxy[:, 1], c='b', alpha=0.1)
 
                 if ais:
                     extent = [23.03014957562005, 23.85354971429277, 37.7, 38.06] # Extend for ais2018db
@@ -1,13 +1,60 @@
+import functools
 import os
 import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
 from sqlalchemy.engine import create_engine
-from shapely.geometry import LineString, Point
 import json
 
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
+
+_EARTH_RADIUS_KM = 6371.0088
+
+
+if njit is not None:
+    @njit(cache=True, parallel=True)
+    def _assign_tids(lon, lat, vstarts, thr_km):
+        '''Per-row tid assignment: resets at vessel boundaries and increments after
+        every haversine gap larger than thr_km. Vessels are independent, so the
+        compiled scan runs one prange iteration per vessel segment [vstarts[v],
+        vstarts[v+1]) across all cores.
+
+        Distances are computed directly from lat/lon in radians, so no projected
+        CRS is needed.
+        '''
+        tid = np.empty(lon.shape[0], dtype=np.int32)
+        for v in prange(vstarts.shape[0] - 1):
+            cur = 0
+            tid[vstarts[v]] = 0
+            for i in range(vstarts[v] + 1, vstarts[v + 1]):
+                dlat = lat[i] - lat[i - 1]
+                dlon = lon[i] - lon[i - 1]
+                h = np.sin(dlat / 2) ** 2 + np.cos(lat[i - 1]) * np.cos(lat[i]) * np.sin(dlon / 2) ** 2
+                if 2 * _EARTH_RADIUS_KM * np.arcsin(np.sqrt(h)) > thr_km:
+                    cur += 1
+                tid[i] = cur
+        return tid
+
+@functools.lru_cache(maxsize=1)
+def _get_config():
+    '''Loads and caches the dbcon.json DB configuration.
+    '''
+    with open(os.path.join(os.getcwd(), "dbcon.json"), "r") as f:
+        return json.load(f)
+
+
+@functools.lru_cache(maxsize=1)
 def _get_engine():
     '''Create a Postgres engine based on dbcon.json DB credentials.
+
+    Cached so the SQLAlchemy connection pool is reused across calls.
     '''
-    data = json.load(open(os.path.join(os.getcwd(), "dbcon.json"), "r"))
+    data = _get_config()
     username = data['username']
     pswd = data['pswd']
     host = data['host']
@@ -18,61 +65,120 @@ def _get_engine():
 
 def _read_db():
     '''Reads the DB using the query in dbcon.json.
-    '''
-    query = json.load(open(os.path.join(os.getcwd(), "dbcon.json"), "r"))['query']
-    gdf = gpd.read_postgis(query, _get_engine(), geom_col='geom', crs=4326)
-    gdf = gdf.sort_values(['mmsi', 't']).reset_index(drop=True)
-    return gdf
 
-
-def _apply_find_gaps(df, dist_threshold):
-    '''Returns the gap indexes of a trajectory, based on dist_threshold
+    Streams the result through a server-side cursor in chunks instead of
+    materializing the full table at once. Returns the frame in EPSG:4326 sorted
+    by (mmsi, t); gap distances are computed with haversine, so no projected CRS
+    is needed.
     '''
-    gaps = df.loc[df['geom'].distance(df['geom'].shift()).values / 1000 > dist_threshold].index.to_list()
+    query = _get_config()['query']
+    with _get_engine().connect().execution_options(stream_results=True) as conn:
+        chunks = gpd.read_postgis(query, conn, geom_col='geom', crs=4326, chunksize=200_000)
+        gdf = pd.concat(list(chunks), ignore_index=True)
+
+    # One lexsort on the raw arrays and a single take, instead of pandas
+    # sort_values building its own sort keys over the whole frame.
+    order = np.lexsort((gdf['t'].to_numpy(), gdf['mmsi'].to_numpy()))
+    gdf = gdf.take(order).reset_index(drop=True)
+    return gdf
 
-    if len(df) > 1 and df.iloc[1]['geom'].distance(df.iloc[0]['geom']) / 1000 > dist_threshold:
-        gaps.extend([df.index.min()])
-    gaps.extend([df.index.min(), df.index.max()])
-    gaps.sort()
-    return gaps
 
+def _split_to_trajectories(gdf, dist_threshold):
+    '''Assigns a trajectory id (tid) per vessel, splitting where two consecutive
+    fixes are further apart than dist_threshold km.
 
-def _apply_split_to_trajectories(object_df, gaps):
-    '''Splits a trajectory based on the gaps.
+    Works on the whole (mmsi, t)-sorted frame in one vectorized pass: consecutive
+    haversine distances come straight from the lat/lon coordinate array, a new
+    trajectory starts at every vessel boundary and after every gap, and tids
+    restart per vessel.
     '''
-    if len(object_df) == 1:
-        return None
-    if len(object_df)<3:
-        object_df.loc[:, 'tid'] = 0
-        return object_df
-
-    for i, (start_ind, end_ind) in enumerate(list(zip(gaps, gaps[1:]))):
-        object_df.loc[start_ind:end_ind, 'tid'] = i
+    coords = np.radians(shapely.get_coordinates(gdf.geometry.values))
+    mmsi = gdf['mmsi'].to_numpy()
+
+    if njit is not None:
+        vstarts = np.flatnonzero(np.r_[True, mmsi[1:] != mmsi[:-1]])
+        vstarts = np.append(vstarts, len(gdf))
+        gdf['tid'] = _assign_tids(np.ascontiguousarray(coords[:, 0]),
+                                  np.ascontiguousarray(coords[:, 1]),
+                                  vstarts, dist_threshold)
+        return gdf
+
+    lon, lat = coords[:, 0], coords[:, 1]
+    h = np.sin(np.diff(lat) / 2) ** 2 + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(np.diff(lon) / 2) ** 2
+    d = 2 * _EARTH_RADIUS_KM * np.arcsin(np.sqrt(h))
+    same = mmsi[1:] == mmsi[:-1]
+
+    new_traj = np.empty(len(gdf), dtype=bool)
+    new_traj[0] = True
+    new_traj[1:] = ~same | (d > dist_threshold)
+
+    # One repeat over the segment lengths labels every row, instead of a
+    # binary search per row.
+    starts = np.flatnonzero(new_traj)
+    seg_lengths = np.diff(np.append(starts, len(gdf)))
+    seg = np.repeat(np.arange(len(starts)), seg_lengths)
+
+    # Restart tids at 0 for every vessel.
+    vstart = np.empty(len(gdf), dtype=bool)
+    vstart[0] = True
+    vstart[1:] = ~same
+    vessel = np.cumsum(vstart) - 1
+    tid = seg - seg[vstart][vessel]
+
+    gdf['tid'] = tid
+    return gdf
 
-    return object_df
 
+def _create_lines_and_ms(gdf_clean):
+    '''Builds one LineString and its midpoint per (mmsi, tid) trajectory in a
+    single sweep.
 
-def _apply_create_lines(gdf):
-    '''Creates a Listestring object, given a trajectory in GeoDataFrame.
+    Groups are contiguous in the sorted frame, so they are enumerated from change
+    flags instead of a groupby, and lines and midpoints share the same coordinate
+    buffer and group boundaries: one shapely.linestrings call and one
+    np.add.reduceat over the kept rows. Trajectories with a single fix are dropped.
     '''
-    
-    start_t = min(gdf['t'])
-    end_t = max(gdf['t'])
-    if len(gdf.geom.tolist()) <= 1:
-        return None
-    else:
-        line = LineString(gdf.geom.tolist())
-        return gpd.GeoDataFrame({"t_s": [start_t], "t_e": [end_t], "geom": [line]}, geometry="geom", crs=4326)   
-
-
-def _apply_calc_m(line):
-    '''Calculates the midpoint of a Line.
+    mmsi = gdf_clean['mmsi'].to_numpy()
+    tid = gdf_clean['tid'].to_numpy()
+    t = gdf_clean['t'].to_numpy()
+
+    new_grp = np.empty(len(gdf_clean), dtype=bool)
+    new_grp[0] = True
+    new_grp[1:] = (mmsi[1:] != mmsi[:-1]) | (tid[1:] != tid[:-1])
+    g = np.cumsum(new_grp) - 1
+
+    starts = np.flatnonzero(new_grp)
+    ends = np.append(starts[1:], len(gdf_clean))
+    keep = (ends - starts) >= 2
+
+    # Renumber the kept groups 0..k-1, as shapely.linestrings expects.
+    rows = keep[g]
+    codes = (np.cumsum(keep) - 1)[g[rows]]
+    coords = shapely.get_coordinates(gdf_clean.geometry.values)[rows]
+    lines = shapely.linestrings(coords, indices=codes)
+
+    counts = (ends - starts)[keep]
+    kept_starts = np.append(0, np.cumsum(counts)[:-1])
+    mean_xy = np.add.reduceat(coords, kept_starts, axis=0) / counts[:, None]
+
+    starts = starts[keep]
+    ends = ends[keep]
+    # Rows are sorted by t within each trajectory, so first/last give t_s/t_e.
+    lines_df = gpd.GeoDataFrame({"mmsi": mmsi[starts], "tid": tid[starts],
+                                 "t_s": t[starts], "t_e": t[ends - 1], "geom": lines},
+                                geometry="geom", crs=4326)
+    # Midpoints stay as plain x/y float columns; no per-row GEOS point objects
+    # are built. Use to_geoseries when actual geometries are needed.
+    m_df = pd.DataFrame({"mmsi": mmsi[starts], "tid": tid[starts],
+                         "t_s": t[starts], "t_e": t[ends - 1],
+                         "x": mean_xy[:, 0], "y": mean_xy[:, 1]})
+    return lines_df, m_df
+
+
+def to_geoseries(m_df):
+    '''Builds a GeoSeries of midpoint geometries from the x/y columns on demand.
     '''
-
-    x_m = sum(x for x in line.geom.iloc[0].xy[0]) / len(line.geom.iloc[0].coords)
-    y_m = sum(y for y in line.geom.iloc[0].xy[1]) / len(line.geom.iloc[0].coords)
-    m = Point(x_m, y_m)
-    return gpd.GeoDataFrame({"t_s": [line['t_s'].iloc[0]], "t_e": [line['t_e'].iloc[0]], "geom": [m]}, geometry="geom", crs=4326)
+    return gpd.GeoSeries(shapely.points(m_df['x'].to_numpy(), m_df['y'].to_numpy()), crs=4326)
 
 
 def preprocessing():
@@ -81,17 +187,13 @@ def preprocessing():
     gdf = _read_db()
 
     dist_threshold = 10 #km
-    gdf.to_crs(2100, inplace=True)
-    gaps = gdf.groupby('mmsi').apply(lambda grp: _apply_find_gaps(grp, dist_threshold))
-    gdf_clean = gdf.groupby('mmsi').apply(lambda grp: _apply_split_to_trajectories(grp, gaps.loc[int(grp.name)]))
-    gdf_clean.set_geometry('geom', inplace=True)
-    gdf_clean.to_crs(4326, inplace=True)
+    gdf_clean = _split_to_trajectories(gdf, dist_threshold)
     gdf_clean.reset_index(drop=True,inplace=True)
 
-    lines_df = gdf_clean.groupby(['mmsi', 'tid']).apply(lambda g: _apply_create_lines(g)).dropna().reset_index().drop("level_2", axis=1)
-    
-    m_df = lines_df.groupby(['mmsi', 'tid']).apply(lambda line: _apply_calc_m(line)).reset_index().drop('level_2', axis=1)
+    lines_df, m_df = _create_lines_and_ms(gdf_clean)
 
-    m_df.to_csv('./ms.csv', index=False)
+    # Plain x/y float columns round-trip through parquet as contiguous buffers,
+    # with no geometry encode/decode step at all.
+    m_df.to_parquet('./ms.parquet', engine='pyarrow', index=False)
 
     return gdf_clean, lines_df, m_df
\ No newline at end of file
@@ -2,10 +2,13 @@ from SpatioTemporal.utils import generate_samples, display
 from SpatioTemporal.spatio_temporal import STC, STHS
 from SpatioTemporal.models import TPoint, Trajectory, Point
 from tabulate import tabulate
+import os
+import pickle
+from pathlib import Path
 import pandas as pd
 import geopandas as gpd
 from preprocessing import preprocessing
-from shapely import wkt
+import shapely
 from typing import List, Dict
 
 def _procedure(trajs : List[Trajectory], time_range : int, interval : int, w : int, 
@@ -26,47 +29,97 @@ def _procedure(trajs : List[Trajectory], time_range : int, interval : int, w : i
 
 
 def _to_trajectories(df) -> List[Trajectory]:
-    """Transforms dataframe of ms (ms.csv calculated in preprocessing.py) in Trajectory list.
-    """
-    trajs = []
-    for i, row in df.iterrows():
-        tps = TPoint(None, None, row['t_s'])
-        tpe = TPoint(None, None, row['t_e'])
-        m = Point(row.geom.coords[0][0], row.geom.coords[0][1])
-        trajs.append(Trajectory(tps, tpe, m=m))
-
-    return trajs
-
+    """Transforms dataframe of ms (calculated in preprocessing.py) in Trajectory list.
 
-def _load_ms() -> gpd.GeoDataFrame:
-    """Loads the ms.csv (calculated in preprocessing.py) in GeoDataFrame.
+    Midpoints come straight from the x/y float columns and timestamps from
+    to_numpy, so the only per-row work left is building the model objects.
     """
-    m_df = pd.read_csv('./ms.csv')
-    m_df.geom = m_df.geom.apply(wkt.loads)
-    m_df = gpd.GeoDataFrame(m_df, crs=4326, geometry='geom')
-    m_df['t_s'] = pd.to_datetime(m_df['t_s'])
-    m_df['t_e'] = pd.to_datetime(m_df['t_e'])
+    x = df['x'].to_numpy()
+    y = df['y'].to_numpy()
+    ts = df['t_s'].to_numpy()
+    te = df['t_e'].to_numpy()
+    return [Trajectory(TPoint(None, None, ts[i]), TPoint(None, None, te[i]),
+                       m=Point(x[i], y[i]))
+            for i in range(len(df))]
+
+
+def _load_ms() -> pd.DataFrame:
+    """Loads the ms file (calculated in preprocessing.py) in a DataFrame with
+    plain x/y midpoint columns.
+
+    Prefers the parquet file written by preprocessing, whose x/y columns load as
+    contiguous buffers with no GEOS objects at all. Older files that still carry
+    a geometry column (WKB parquet or WKT csv) are decoded with one bulk shapely
+    call and converted to x/y.
+    """
+    if os.path.exists('./ms.parquet'):
+        m_df = pd.read_parquet('./ms.parquet', engine='pyarrow')
+        if 'geom' in m_df.columns:
+            # Older parquet files stored the midpoints as WKB.
+            coords = shapely.get_coordinates(shapely.from_wkb(m_df.pop('geom').to_numpy()))
+            m_df['x'], m_df['y'] = coords[:, 0], coords[:, 1]
+    else:
+        m_df = pd.read_csv('./ms.csv')
+        coords = shapely.get_coordinates(shapely.from_wkt(m_df.pop('geom').to_numpy()))
+        m_df['x'], m_df['y'] = coords[:, 0], coords[:, 1]
+    m_df['t_s'] = pd.to_datetime(m_df['t_s'], cache=True)
+    m_df['t_e'] = pd.to_datetime(m_df['t_e'], cache=True)
     return m_df
 
 
 def _convert_timestamp(df) -> gpd.GeoDataFrame:
     """Converts timestamps to intergers in [0, max_timestamp - min_timestamp] range.
     """
-    df['t_s'] = pd.to_datetime(df['t_s'])
-    df['t_e'] = pd.to_datetime(df['t_e'])
-
-    df['t_s'] = df['t_s'].view('int64') // 10 ** 9
-    df['t_e'] = df['t_e'].view('int64') // 10 ** 9
-    min_t = df['t_s'].min()
-    df['t_s'] -= min_t
-    df['t_e'] -= min_t
+    # The loader already yields datetime columns; re-parse only if needed.
+    if not pd.api.types.is_datetime64_any_dtype(df['t_s']):
+        df['t_s'] = pd.to_datetime(df['t_s'])
+        df['t_e'] = pd.to_datetime(df['t_e'])
+
+    # Viewing the second-resolution datetimes as int64 skips the // 10**9
+    # division and its temporaries.
+    t_s = df['t_s'].to_numpy('datetime64[s]').view('i8')
+    t_e = df['t_e'].to_numpy('datetime64[s]').view('i8')
+    min_t = t_s.min()
+    t_s -= min_t
+    t_e -= min_t
+    df['t_s'] = t_s
+    df['t_e'] = t_e
 
     return df
 
 
+_TRAJS_CACHE = Path('./trajs.pkl')
+
+
+def _ms_path() -> Path:
+    """Returns the path of the ms file preprocessing wrote, preferring parquet.
+    """
+    p = Path('./ms.parquet')
+    return p if p.exists() else Path('./ms.csv')
+
+
+def _load_trajs():
+    """Loads the Trajectory list and its time range, using a pickle cache.
+
+    The cache is reused as long as it is newer than the ms file, so repeated
+    experiments skip the load-convert-rebuild step entirely.
+    """
+    ms = _ms_path()
+    if _TRAJS_CACHE.exists() and ms.exists() and _TRAJS_CACHE.stat().st_mtime >= ms.stat().st_mtime:
+        with open(_TRAJS_CACHE, 'rb') as f:
+            return pickle.load(f)
+
+    m_df = _convert_timestamp(_load_ms())
+    trajs = _to_trajectories(m_df)
+    time_range = int(m_df['t_e'].max())
+    with open(_TRAJS_CACHE, 'wb') as f:
+        pickle.dump((trajs, time_range), f, protocol=5)
+    return trajs, time_range
+
+
 def real_test(i=-1, preprocess=False, interval=None, w=None, g_clustering_args=None, v_clustering_args=None, a=None):
     """Executes STC and STHS using ais data. If 'preprocess' == True then it computes the ms from raw data,
-    else loads the precomputed ms from the ms.csv.
+    else loads the precomputed ms (through the trajs.pkl cache when it is up to date).
 
     Notes
     -----
@@ -89,15 +142,14 @@ def real_test(i=-1, preprocess=False, interval=None, w=None, g_clustering_args=N
     a : float, default=None
         The significance level for the hypothesis testing.
     """
-    trajs = []
     if preprocess:
         _, _, m_df = preprocessing()
+        m_df = _convert_timestamp(m_df)
+        trajs = _to_trajectories(m_df)
+        time_range = int(m_df['t_e'].max())
     else:
-        m_df = _load_ms()
-    
-    m_df = _convert_timestamp(m_df)
+        trajs, time_range = _load_trajs()
 
-    time_range = m_df['t_e'].max()
     if i == 0:
         interval=60*60*24*2 # 2 days
         w = 15 # 2 days * 15 = 30 days
@@ -122,9 +174,7 @@ def real_test(i=-1, preprocess=False, interval=None, w=None, g_clustering_args=N
         g_clustering_args = {"eps": 0.020, "min_samples": 10}
         v_clustering_args = {"eps": 0.030, "min_samples": 12}
         a = 0.01
-        
 
-    trajs = _to_trajectories(m_df)
 
     data = [[len(trajs), time_range, interval, w, g_clustering_args, v_clustering_args, a]]
     headers = ["N", "time_range (s)", "interval (s)", "w (time partitions)", "g_clustering_args", "v_clustering_args", "a"]